@@ -18,6 +18,7 @@ import arcpy
 import os
 import sys
 import datetime
+import functools
 from sys import argv
 
 #%% 2 Define functions
@@ -40,14 +41,66 @@ def printerror(message):
         print(message)
 
 # Define field exists function
+# Field names are cached per dataset. Clear the cache after adding or deleting fields.
+
+@functools.lru_cache(maxsize=64)
+def _list_field_names(dataset):
+    return frozenset(field.name for field in arcpy.ListFields(dataset))
 
 def FieldExists(dataset, field_name):
-    if field_name in [field.name for field in arcpy.ListFields(dataset)]:
+    if field_name in _list_field_names(dataset):
         return True
     else:
         printerror("Error: {0} field does not exist in {1}."
                 .format(field_name, os.path.basename(dataset)))
 
+# Define function to build field mappings for a table without the listed fields
+
+def keep_field_mappings(table, candidates):
+    candidates = {name.upper() for name in candidates}
+    field_mappings = arcpy.FieldMappings()
+    field_mappings.addTable(table)
+    for name in _list_field_names(table):
+        if name.upper() in candidates:
+            index = field_mappings.findFieldMapIndex(name)
+            if index != -1:
+                field_mappings.removeFieldMap(index)
+    return field_mappings
+
+# Define CWI fields that are not needed by subsequent tools.
+# Field names are matched without regard to case.
+
+CONS_DROP = frozenset(["diameter", "slot", "length", "material", "amount",
+                       "units", "OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID",
+                       "relateid_1", "unique_no", "wellname", "township", "range", "range_dir",
+                       "section", "subsection", "mgsquad_c", "elevation", "elev_mc", "status_c", "use_c",
+                       "loc_mc", "loc_src", "data_src", "depth_drll", "depth_comp", "date_drll",
+                       "case_diam", "case_depth", "grout", "pollut_dst", "pollut_dir", "pollut_typ",
+                       "strat_date", "strat_upd", "strat_src", "strat_geol", "strat_mc", "depth2bdrk",
+                       "first_bdrk", "last_strat", "ohtopunit", "ohbotunit", "aquifer", "cuttings", "core",
+                       "bhgeophys", "geochem", "waterchem", "obwell", "swl", "dh_video", "input_src", "unused",
+                       "entry_date", "updt_date", "geoc_type", "gcm_code", "geoc_src", "geoc_prg", "utme", "utmn",
+                       "geoc_entry", "geoc_date", "geocupd_entry", "geocupd_date", "rcvd_date", "well_label",
+                       "wellid_1", "swlcount", "swldate", "swlavgmeas", "swlavgelev", "bdrkelev", "ohtopelev",
+                       "ohbotelev", "botholelev", "logurl", "straturl", "ORIG_FID"])
+
+DPL_DROP = frozenset(["drill_meth", "drill_flud", "hydrofrac", "hffrom", "hfto", "case_mat", "case_joint",
+                      "case_top", "drive_shoe", "case_type", "screen", "ohtopfeet", "ohbotfeet", "screen_mfg",
+                      "screen_typ", "ptlss_mfg", "ptlss_mdl", "bsmt_offst", "csg_top_ok","csg_at_grd", "plstc_prot",
+                      "disinfectd", "pump_inst", "pump_date", "pump_mfg","pump_model", "pump_hp", "pump_volts", "dropp_mat",
+                      "pump_cpcty","pump_type", "variance", "drllr_name", "entry_date", "updt_date","utme", "utmn",
+                      "diameter", "slot", "length", "material", "amount", "units",
+                      "OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID", "relateid_1", "unique_no", "wellname",
+                      "township", "range", "range_dir", "section", "subsection", "mgsquad_c", "elevation", "elev_mc", "status_c",
+                      "use_c", "loc_mc", "loc_src", "data_src", "depth_drll", "depth_comp", "date_drll", "case_diam",
+                      "case_depth", "grout", "pollut_dst", "pollut_dir", "pollut_typ", "strat_date", "strat_upd",
+                      "strat_src", "strat_geol", "strat_mc", "depth2bdrk", "first_bdrk", "last_strat", "ohtopunit",
+                      "ohbotunit", "aquifer", "cuttings", "core", "bhgeophys", "geochem", "waterchem", "obwell", "swl",
+                      "dh_video", "input_src", "unused", "entry_date_1", "updt_date_1", "geoc_type", "gcm_code", "geoc_src",
+                      "geoc_prg", "geoc_entry", "geoc_date", "geocupd_entry", "geocupd_date", "rcvd_date",
+                      "well_label", "wellid_1", "swlcount", "swldate", "swlavgmeas", "swlavgelev", "bdrkelev", "ohtopelev",
+                      "ohbotelev", "botholelev", "logurl", "straturl", "ORIG_FID"])
+
 # %% 3 Set parameters
 
 # input parameters for geoprocessing tool
@@ -59,6 +112,7 @@ dpl_y_field = "utmn" #arcpy.GetParameterAsText(4) #UTM y coordinates field in dp
 spatial_ref = arcpy.SpatialReference(26915) #NAD 1983 UTM Zone 15N
 swl_pts = arcpy.GetParameterAsText(3)  #gdb table with static water level info.
 strat_table = arcpy.GetParameterAsText(4) #gdb table with strat/lith info
+inter_ws = "memory" #workspace for temporary files that are deleted before the tool finishes
 printit("Variables set with tool parameter inputs.")
 
 # To allow overwriting outputs change overwriteOutput option to True.
@@ -73,43 +127,29 @@ arcpy.env.overwriteOutput = True
 
 printit("Begin cleaning construction table.")
 
-# Copy construction table
-printit("Copying construction table.")
-cons_copy = os.path.join(workspace, "cons_copy")
-arcpy.management.Copy(cons_table, cons_copy)
-
-#Delete extra Fields
-printit("Deleting extra fields from construction table copy.")
-cons_copy_1 = arcpy.management.DeleteField(cons_copy, ["diameter", "slot", "length", "material", "amount",
-                                                        "units", "OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID",
-                                                        "relateid_1", "unique_no", "wellname", "township", "range", "range_dir",
-                                                        "section", "subsection", "mgsquad_c", "elevation", "elev_mc", "status_c", "use_c",
-                                                        "loc_mc", "loc_src", "data_src", "depth_drll", "depth_comp", "date_drll",
-                                                        "case_diam", "case_depth", "grout", "pollut_dst", "pollut_dir", "pollut_typ",
-                                                        "strat_date", "strat_upd", "strat_src", "strat_geol", "strat_mc", "depth2bdrk",
-                                                        "first_bdrk", "last_strat", "ohtopunit", "ohbotunit", "aquifer", "cuttings", "core",
-                                                        "bhgeophys", "geochem", "waterchem", "obwell", "swl", "dh_video", "input_src", "unused",
-                                                        "entry_date", "updt_date", "geoc_type", "gcm_code", "geoc_src", "geoc_prg", "utme", "utmn",
-                                                        "geoc_entry", "geoc_date", "geocupd_entry", "geocupd_date", "rcvd_date", "well_label",
-                                                        "wellid_1", "swlcount", "swldate", "swlavgmeas", "swlavgelev", "bdrkelev", "ohtopelev",
-                                                        "ohbotelev", "botholelev", "logurl", "straturl", "ORIG_FID"])[0]
-
-#Table Select (Table Select) (analysis)
-printit("Removing non screen or casing records from construction table copy.")
+# Copy screen and casing records from construction table without extra fields
+printit("Copying screen and casing records from construction table without extra fields.")
 cons_cwi_clean = os.path.join(workspace, "cons_clean")
-arcpy.analysis.TableSelect(cons_copy_1, cons_cwi_clean, "constype = 'C' Or constype = 'S' Or constype = 'H'")
+arcpy.conversion.ExportTable(cons_table, cons_cwi_clean, "constype IN ('C', 'S', 'H')",
+                             field_mapping=keep_field_mappings(cons_table, CONS_DROP))
 
 #Add Fields
 printit("Adding required fields to construction table copy.")
 cons_cwi_TableSelect_3_ = arcpy.management.AddFields(cons_cwi_clean,[["elev_top", "FLOAT", "", "", "", ""], ["elev_bot", "FLOAT", "", "", "", ""]])[0]
+_list_field_names.cache_clear()
 
-#Calculate Null depth_from fields for Casing
+# Set null 'depth_from' values for casing records to zero and calculate new fields in a single pass
 printit("Setting null 'depth_from' field values for casing records to zero.")
-cons_cwi_TableSelect_4_ = arcpy.management.CalculateField(cons_cwi_TableSelect_3_, "from_depth", "0 if !constype! is 'C' and !from_depth! is None else !from_depth!")[0]
-
-# Calculate new Fields
 printit("Calculating elev_top and elev_bot field values.")
-cons_cwi_TableSelect_5_ = arcpy.management.CalculateFields(cons_cwi_TableSelect_4_,"PYTHON3",[["elev_top", "!dem! - !from_depth!", ""], ["elev_bot", "!dem! - !to_depth!", ""]])[0]
+with arcpy.da.UpdateCursor(cons_cwi_TableSelect_3_, ["constype", "dem", "from_depth", "to_depth", "elev_top", "elev_bot"]) as cursor:
+    for row in cursor:
+        if row[0] == 'C' and row[2] is None:
+            row[2] = 0
+        dem = row[1]
+        if dem is not None:
+            row[4] = dem - row[2] if row[2] is not None else None
+            row[5] = dem - row[3] if row[3] is not None else None
+        cursor.updateRow(row)
 
 
 #%% 5 Clean drop pipe data
@@ -117,40 +157,16 @@ cons_cwi_TableSelect_5_ = arcpy.management.CalculateFields(cons_cwi_TableSelect_
 if dpl_table != '':
     printit("Begin cleaning drop pipe data.")
 
-    # Copy dpl table
-    printit("Copying drop pipe table.")
-    dpl_copy = os.path.join(workspace, "dpl_copy")
-    arcpy.management.Copy(dpl_table, dpl_copy)
-
     # XY Table To Point
+    printit("Creating temporary dpl_cwi mapview points.")
+    dpl_copy = os.path.join(inter_ws, "dpl_copy")
+    arcpy.management.XYTableToPoint(dpl_table, dpl_copy, dpl_x_field, dpl_y_field, "",spatial_ref)
+
+    # Copy points without extra fields
     printit("Creating dpl_cwi mapview points for input to 2D point tool.")
     dpl_cwi_pt = os.path.join(workspace, "dpl_clean")
-    arcpy.management.XYTableToPoint(dpl_copy, dpl_cwi_pt, dpl_x_field, dpl_y_field, "",spatial_ref)
-
-    #Delete extra Fields
-    printit("Deleting extra fields from dpl table copy.")
-    dpl_copy_1 = arcpy.management.DeleteField(dpl_cwi_pt, ["drill_meth", "drill_flud", "hydrofrac", "hffrom", "hfto", "case_mat", "case_joint",
-                                                        "case_top", "drive_shoe", "case_type", "screen", "ohtopfeet", "ohbotfeet", "screen_mfg",
-                                                        "screen_typ", "ptlss_mfg", "ptlss_mdl", "bsmt_offst", "csg_top_ok","csg_at_grd", "plstc_prot",
-                                                        "disinfectd", "pump_inst", "pump_date", "pump_mfg","pump_model", "pump_hp", "pump_volts", "dropp_mat",
-                                                        "pump_cpcty","pump_type", "variance", "drllr_name", "entry_date", "updt_date","utme", "utmn",
-                                                        "diameter", "slot", "length", "material", "amount", "units",
-                                                        "OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID", "relateid_1", "unique_no", "wellname",
-                                                        "township", "range", "range_dir", "section", "subsection", "mgsquad_c", "elevation", "elev_mc", "status_c",
-                                                        "use_c", "loc_mc", "loc_src", "data_src", "depth_drll", "depth_comp", "date_drll", "case_diam",
-                                                        "case_depth", "grout", "pollut_dst", "pollut_dir", "pollut_typ", "strat_date", "strat_upd",
-                                                        "strat_src", "strat_geol", "strat_mc", "depth2bdrk", "first_bdrk", "last_strat", "ohtopunit",
-                                                        "ohbotunit", "aquifer", "cuttings", "core", "bhgeophys", "geochem", "waterchem", "obwell", "swl",
-                                                        "dh_video", "input_src", "unused", "entry_date_1", "updt_date_1", "geoc_type", "gcm_code", "geoc_src",
-                                                        "geoc_prg", "geoc_entry", "geoc_date", "geocupd_entry", "geocupd_date", "rcvd_date",
-                                                        "well_label", "wellid_1", "swlcount", "swldate", "swlavgmeas", "swlavgelev", "bdrkelev", "ohtopelev",
-                                                        "ohbotelev", "botholelev", "logurl", "straturl", "ORIG_FID"])[0]
-    printit("Deleting temporary files from output geodatabase.")
-    try:
-        arcpy.management.Delete(dpl_copy)
-
-    except:
-        printit("Warning: unable to delete all temporary files.")
+    dpl_copy_1 = arcpy.conversion.ExportFeatures(dpl_copy, dpl_cwi_pt,
+                                                 field_mapping=keep_field_mappings(dpl_copy, DPL_DROP))[0]
 
 #%% 6 Clean swl data
 
@@ -167,8 +183,18 @@ swl_copy_1 = arcpy.management.DeleteField(swl_copy, ["Join_Count", "TARGET_FID",
                                                      "first_bdrk", "last_strat", "ohtopunit","ohtopelev", "ohbotunit","ohbotelev",
                                                      "botholelev","entry_date", "updt_date", "ORIG_FID"])[0]
 
+# Add meas_elev field if it is not already in the swl table
+if not any(name.upper() == "MEAS_ELEV" for name in _list_field_names(swl_copy_1)):
+    arcpy.management.AddField(swl_copy_1, "meas_elev", "DOUBLE")
+    _list_field_names.cache_clear()
+
 printit("Recalculating elevation and meas_elev fields using DEM.")
-swl_TableSelect_1_ = arcpy.management.CalculateFields(swl_copy_1,"PYTHON3",[["elevation", "!dem!", ""], ["meas_elev", "!dem! - !measuremt!", ""]])[0]
+with arcpy.da.UpdateCursor(swl_copy_1, ["dem", "measuremt", "elevation", "meas_elev"]) as cursor:
+    for row in cursor:
+        dem = row[0]
+        row[2] = dem
+        row[3] = dem - row[1] if dem is not None and row[1] is not None else None
+        cursor.updateRow(row)
 
 
 #%% 7 Clean Strat table
@@ -188,19 +214,33 @@ if strat_table != '':
                                                             "first_bdrk", "last_strat", "ohtopunit", "ohbotunit", "bdrkelev", "ohtopelev",
                                                             "ohbotelev", "botholelev","ORIG_FID"])[0]
 
-    # Calculate new Fields
+    # Add elev_top and elev_bot fields if they are not already in the strat table
+    strat_field_names = {name.upper() for name in _list_field_names(strat_copy_1)}
+    for newfield in ["elev_top", "elev_bot"]:
+        if newfield.upper() not in strat_field_names:
+            arcpy.management.AddField(strat_copy_1, newfield, "FLOAT")
+            _list_field_names.cache_clear()
+
+    # Calculate new Fields in a single pass over the table
     printit("Recalculating elevation, elev_top and elev_bot fields using DEM.")
-    strat_cwi_TableSelect_1_ = arcpy.management.CalculateFields(strat_copy_1,"PYTHON3",[["elevation", "!dem!", ""],["elev_top", "!dem! - !depth_top!", ""], ["elev_bot", "!dem! - !depth_bot!", ""]])[0]
+    with arcpy.da.UpdateCursor(strat_copy_1, ["dem", "depth_top", "depth_bot", "elevation", "elev_top", "elev_bot"]) as cursor:
+        for row in cursor:
+            dem = row[0]
+            row[3] = dem
+            row[4] = dem - row[1] if dem is not None and row[1] is not None else None
+            row[5] = dem - row[2] if dem is not None and row[2] is not None else None
+            cursor.updateRow(row)
 
 
 #%% 8 Delete temporary files/fields
 
-printit("Deleting temporary files from output geodatabase.")
-try:
-    arcpy.management.Delete(cons_copy)
+if dpl_table != '':
+    printit("Deleting temporary files from memory.")
+    try:
+        arcpy.management.Delete(dpl_copy)
 
-except:
-    printit("Warning: unable to delete all temporary files.")
+    except:
+        printit("Warning: unable to delete all temporary files.")
 ##
 #%% 9 Record and print tool end time
 toolend = datetime.datetime.now()
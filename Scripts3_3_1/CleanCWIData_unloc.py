@@ -18,6 +18,7 @@ import arcpy
 import os
 import sys
 import datetime
+import functools
 from sys import argv
 
 #%% 2 Define functions
@@ -26,28 +27,78 @@ from sys import argv
 toolstart = datetime.datetime.now()
 
 # Define print statement functions for testing and compiled geoprocessing tool
+# Whether the script is running as a geoprocessing tool is checked once at start.
+
+_USE_ARCPY = len(sys.argv) > 1
+_log = arcpy.AddMessage if _USE_ARCPY else print
+_log_error = arcpy.AddError if _USE_ARCPY else print
 
 def printit(message):
-    if (len(sys.argv) > 1):
-        arcpy.AddMessage(message)
-    else:
-        print(message)
+    _log(message)
 
 def printerror(message):
-    if (len(sys.argv) > 1):
-        arcpy.AddError(message)
-    else:
-        print(message)
+    _log_error(message)
 
 # Define field exists function
+# Field names are cached per dataset. Clear the cache after adding or deleting fields.
+
+@functools.lru_cache(maxsize=64)
+def _list_field_names(dataset):
+    return frozenset(field.name for field in arcpy.ListFields(dataset))
 
 def FieldExists(dataset, field_name):
-    if field_name in [field.name for field in arcpy.ListFields(dataset)]:
+    if field_name in _list_field_names(dataset):
         return True
     else:
         printerror("Error: {0} field does not exist in {1}."
                 .format(field_name, os.path.basename(dataset)))
 
+# Define function to build field mappings for a table without the listed fields
+
+def keep_field_mappings(table, candidates):
+    candidates = {name.upper() for name in candidates}
+    field_mappings = arcpy.FieldMappings()
+    field_mappings.addTable(table)
+    for name in _list_field_names(table):
+        if name.upper() in candidates:
+            index = field_mappings.findFieldMapIndex(name)
+            if index != -1:
+                field_mappings.removeFieldMap(index)
+    return field_mappings
+
+# Define CWI fields that are not needed by subsequent tools.
+# Field names are matched without regard to case.
+
+COMMON_CWI_BOILERPLATE = frozenset(["OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID", "RELATEID_1", "UNIQUE_NO",
+                                    "WELLNAME", "TOWNSHIP", "RANGE", "RANGE_DIR", "SECTION", "SUBSECTION", "MGSQUAD_C",
+                                    "ELEV_MC", "STATUS_C", "USE_C", "LOC_MC", "LOC_SRC", "DATA_SRC", "DEPTH_DRLL",
+                                    "DEPTH_COMP", "DATE_DRLL", "CASE_DIAM", "CASE_DEPTH", "GROUT", "POLLUT_DST", "POLLUT_DIR",
+                                    "POLLUT_TYP", "STRAT_DATE", "STRAT_UPD", "STRAT_SRC", "STRAT_GEOL", "STRAT_MC",
+                                    "DEPTH2BDRK", "FIRST_BDRK", "LAST_STRAT", "OHTOPUNIT", "OHBOTUNIT", "CUTTINGS", "CORE",
+                                    "BHGEOPHYS", "GEOCHEM", "WATERCHEM", "OBWELL", "SWL", "DH_VIDEO", "INPUT_SRC", "UNUSED",
+                                    "ENTRY_DATE", "UPDT_DATE", "GEOC_TYPE", "GCM_CODE", "GEOC_SRC", "GEOC_PRG", "UTME", "UTMN",
+                                    "GEOC_ENTRY", "GEOC_DATE", "GEOCUPD_ENTRY", "GEOCUPD_DATE", "RCVD_DATE", "WELL_LABEL",
+                                    "WELLID_1", "SWLCOUNT", "SWLDATE", "SWLAVGMEAS", "SWLAVGELEV", "BDRKELEV", "OHTOPELEV",
+                                    "OHBOTELEV", "BOTHOLELEV", "LOGURL", "STRATURL", "ORIG_FID"])
+
+CONS_EXTRA = frozenset(["diameter", "slot", "length", "material", "amount", "units", "AQUIFER"])
+
+DPL_EXTRA = frozenset(["drill_meth", "drill_flud", "hydrofrac", "hffrom", "hfto", "case_mat", "case_joint",
+                       "case_top", "drive_shoe", "case_type", "screen", "ohtopfeet", "ohbotfeet", "screen_mfg",
+                       "screen_typ", "ptlss_mfg", "ptlss_mdl", "bsmt_offst", "csg_top_ok", "csg_at_grd",
+                       "plstc_prot", "disinfectd", "pump_inst", "pump_date", "pump_mfg", "pump_model", "pump_hp",
+                       "pump_volts", "dropp_mat", "pump_cpcty", "pump_type", "variance", "drllr_name", "diameter",
+                       "slot", "length", "material", "amount", "units", "AQUIFER"])
+
+SWL_EXTRA = frozenset()
+
+STRAT_EXTRA = frozenset(["COUNTY_C"])
+
+CONS_DROP = COMMON_CWI_BOILERPLATE | CONS_EXTRA
+DPL_DROP = COMMON_CWI_BOILERPLATE | DPL_EXTRA
+SWL_DROP = COMMON_CWI_BOILERPLATE | SWL_EXTRA
+STRAT_DROP = COMMON_CWI_BOILERPLATE | STRAT_EXTRA
+
 # %% 3 Set parameters
 
 # input parameters for geoprocessing tool
@@ -61,164 +112,134 @@ swl_table = arcpy.GetParameterAsText(3)  #gdb table with static water level info
 swl_x_field = "UTME" #arcpy.GetParameterAsText(6) #UTM x coordinate field in swl table
 swl_y_field = "UTMN"#arcpy.GetParameterAsText(7) #UTM y coordinates field in swl table
 strat_table = arcpy.GetParameterAsText(4) #gdb table with strat/lith info
+inter_ws = "memory" #workspace for temporary files that are deleted before the tool finishes
 printit("Variables set with tool parameter inputs.")
 
 # To allow overwriting outputs change overwriteOutput option to True.
 arcpy.env.overwriteOutput = True
 
+# Allow geoprocessing tools that support parallel processing to use all cores.
+arcpy.env.parallelProcessingFactor = "100%"
+
 #%% 4 Clean Construction table
 
+# Step progressor through the four cleaning sections
+arcpy.SetProgressor("step", "Cleaning CWI data...", 0, 4, 1)
+
+arcpy.SetProgressorLabel("Cleaning construction table...")
 printit("Begin cleaning construction table.")
 
-# Copy construction table
-printit("Copying construction table.")
-cons_copy = os.path.join(workspace, "cons_unloc_copy")
-arcpy.management.Copy(cons_table, cons_copy)
-
-#Delete extra Fields
-printit("Deleting extra fields from construction table copy.")
-cons_copy_1 = arcpy.management.DeleteField(cons_copy, ["diameter", "slot", "length", "material", "amount",
-                                                        "units", "OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID",
-                                                        "RELATEID_1", "UNIQUE_NO", "WELLNAME", "TOWNSHIP", "RANGE", "RANGE_DIR",
-                                                        "SECTION", "SUBSECTION", "MGSQUAD_C", "ELEV_MC", "STATUS_C", "USE_C",
-                                                        "LOC_MC", "LOC_SRC", "DATA_SRC", "DEPTH_DRLL", "DEPTH_COMP", "DATE_DRLL",
-                                                        "CASE_DIAM", "CASE_DEPTH", "GROUT", "POLLUT_DST", "POLLUT_DIR", "POLLUT_TYP",
-                                                        "STRAT_DATE", "STRAT_UPD", "STRAT_SRC", "STRAT_GEOL", "STRAT_MC", "DEPTH2BDRK",
-                                                        "FIRST_BDRK", "LAST_STRAT", "OHTOPUNIT", "OHBOTUNIT", "AQUIFER", "CUTTINGS", "CORE",
-                                                        "BHGEOPHYS", "GEOCHEM", "WATERCHEM", "OBWELL", "SWL", "DH_VIDEO", "INPUT_SRC", "UNUSED",
-                                                        "ENTRY_DATE", "UPDT_DATE", "GEOC_TYPE", "GCM_CODE", "GEOC_SRC", "GEOC_PRG", "UTME", "UTMN",
-                                                        "GEOC_ENTRY", "GEOC_DATE", "GEOCUPD_ENTRY", "GEOCUPD_DATE", "RCVD_DATE", "WELL_LABEL",
-                                                        "WELLID_1", "SWLCOUNT", "SWLDATE", "SWLAVGMEAS", "SWLAVGELEV", "BDRKELEV", "OHTOPELEV",
-                                                        "OHBOTELEV", "BOTHOLELEV", "LOGURL", "STRATURL", "ORIG_FID"])[0]
-
-#Table Select (Table Select) (analysis)
-printit("Removing non screen or casing records from construction table copy.")
+# Copy screen and casing records from construction table without extra fields
+printit("Copying screen and casing records from construction table without extra fields.")
 cons_cwi_clean = os.path.join(workspace, "cons_unloc_clean")
-arcpy.analysis.TableSelect(cons_copy_1, cons_cwi_clean, "constype = 'C' Or constype = 'S' Or constype = 'H'")
+arcpy.conversion.ExportTable(cons_table, cons_cwi_clean, "constype IN ('C', 'S', 'H')",
+                             field_mapping=keep_field_mappings(cons_table, CONS_DROP))
 
 #Add Fields
 printit("Adding required fields to construction table copy.")
 cons_cwi_TableSelect_3_ = arcpy.management.AddFields(cons_cwi_clean,[["elev_top", "FLOAT", "", "", "", ""], ["elev_bot", "FLOAT", "", "", "", ""]])[0]
+_list_field_names.cache_clear()
 
-#Calculate Null depth_from fields for Casing
+# Set null 'depth_from' values for casing records to zero and calculate new fields in a single pass
 printit("Setting null 'depth_from' field values for casing records to zero.")
-cons_cwi_TableSelect_4_ = arcpy.management.CalculateField(cons_cwi_TableSelect_3_, "from_depth", "0 if !constype! is 'C' and !from_depth! is None else !from_depth!")[0]
-
-# Calculate new Fields
 printit("Calculating elev_top and elev_bot field values.")
-cons_cwi_TableSelect_5_ = arcpy.management.CalculateFields(cons_cwi_TableSelect_4_,"PYTHON3",[["elev_top", "!dem! - !from_depth!", ""], ["elev_bot", "!dem! - !to_depth!", ""]])[0]
+with arcpy.da.Editor(workspace): #edit session commits or rolls back all cursor updates together
+    with arcpy.da.UpdateCursor(cons_cwi_TableSelect_3_, ["constype", "dem", "from_depth", "to_depth", "elev_top", "elev_bot"]) as cursor:
+        for row in cursor:
+            if row[0] == 'C' and row[2] is None:
+                row[2] = 0
+            dem = row[1]
+            if dem is not None:
+                row[4] = dem - row[2] if row[2] is not None else None
+                row[5] = dem - row[3] if row[3] is not None else None
+            cursor.updateRow(row)
 
 
 #%% 5 Clean drop pipe data
 
+arcpy.SetProgressorPosition()
+arcpy.SetProgressorLabel("Cleaning drop pipe data...")
 printit("Begin cleaning drop pipe data.")
 
-# Copy dpl table
-printit("Copying drop pipe table.")
-dpl_copy = os.path.join(workspace, "dpl_unloc_copy")
-arcpy.management.Copy(dpl_table, dpl_copy)
-
 # XY Table To Point
+printit("Creating temporary dpl_cwi mapview points.")
+dpl_copy = os.path.join(inter_ws, "dpl_unloc_copy")
+arcpy.management.XYTableToPoint(dpl_table, dpl_copy, dpl_x_field, dpl_y_field, "",spatial_ref)
+
+# Copy points without extra fields
 printit("Creating dpl_cwi mapview points for input to 2D point tool.")
 dpl_cwi_pt = os.path.join(workspace, "dpl_unloc_clean")
-arcpy.management.XYTableToPoint(dpl_copy, dpl_cwi_pt, dpl_x_field, dpl_y_field, "",spatial_ref)
-
-#Delete extra Fields
-printit("Deleting extra fields from dpl table copy.")
-dpl_copy_1 = arcpy.management.DeleteField(dpl_cwi_pt, ["drill_meth", "drill_flud", "hydrofrac", "hffrom", "hfto", "case_mat", "case_joint",
-                                                     "case_top", "drive_shoe", "case_type", "screen", "ohtopfeet", "ohbotfeet", "screen_mfg",
-                                                     "screen_typ", "ptlss_mfg", "ptlss_mdl", "bsmt_offst", "csg_top_ok","csg_at_grd", "plstc_prot",
-                                                     "disinfectd", "pump_inst", "pump_date", "pump_mfg","pump_model", "pump_hp", "pump_volts", "dropp_mat",
-                                                     "pump_cpcty","pump_type", "variance", "drllr_name", "entry_date", "updt_date","utme", "utmn",
-                                                     "diameter", "slot", "length", "material", "amount", "units",
-                                                     "objectid_1", "Join_Count", "TARGET_FID", "JOIN_FID", "RELATEID_1", "UNIQUE_NO", "WELLNAME", "TOWNSHIP",
-                                                     "RANGE", "RANGE_DIR",
-                                                     "SECTION", "SUBSECTION", "MGSQUAD_C", "ELEV_MC", "STATUS_C", "USE_C",
-                                                     "LOC_MC", "LOC_SRC", "DATA_SRC", "DEPTH_DRLL", "DEPTH_COMP", "DATE_DRLL",
-                                                     "CASE_DIAM", "CASE_DEPTH", "GROUT", "POLLUT_DST", "POLLUT_DIR", "POLLUT_TYP",
-                                                     "STRAT_DATE", "STRAT_UPD", "STRAT_SRC", "STRAT_GEOL", "STRAT_MC", "DEPTH2BDRK",
-                                                     "FIRST_BDRK", "LAST_STRAT", "OHTOPUNIT", "OHBOTUNIT", "AQUIFER", "CUTTINGS", "CORE",
-                                                     "BHGEOPHYS", "GEOCHEM", "WATERCHEM", "OBWELL", "SWL", "DH_VIDEO", "INPUT_SRC", "UNUSED",
-                                                     "ENTRY_DATE", "UPDT_DATE", "GEOC_TYPE", "GCM_CODE", "GEOC_SRC", "GEOC_PRG", "UTME", "UTMN",
-                                                     "GEOC_ENTRY", "GEOC_DATE", "GEOCUPD_ENTRY", "GEOCUPD_DATE", "RCVD_DATE", "WELL_LABEL",
-                                                     "WELLID_1", "SWLCOUNT", "SWLDATE", "SWLAVGMEAS", "SWLAVGELEV", "BDRKELEV", "OHTOPELEV",
-                                                     "OHBOTELEV", "BOTHOLELEV", "LOGURL", "STRATURL", "ORIG_FID"])[0]
+dpl_copy_1 = arcpy.conversion.ExportFeatures(dpl_copy, dpl_cwi_pt,
+                                             field_mapping=keep_field_mappings(dpl_copy, DPL_DROP))[0]
 
 #%% 6 Clean swl data
 
+arcpy.SetProgressorPosition()
+arcpy.SetProgressorLabel("Cleaning swl data...")
 printit("Begin cleaning swl data.")
 
-# Copy swl table
-printit("Copying swl table.")
-swl_copy = os.path.join(workspace, "swl_unloc_copy")
-arcpy.management.Copy(swl_table, swl_copy)
-
 # XY Table To Point
+printit("Creating temporary swl_cwi mapview points.")
+swl_copy = os.path.join(inter_ws, "swl_unloc_copy")
+arcpy.management.XYTableToPoint(swl_table, swl_copy, swl_x_field, swl_y_field, "",spatial_ref)
+
+# Copy points without extra fields
 printit("Creating swl_cwi mapview points for input to 2D point tool.")
 swl_cwi_pt = os.path.join(workspace, "swl_unloc_clean")
-arcpy.management.XYTableToPoint(swl_copy, swl_cwi_pt, swl_x_field, swl_y_field, "",spatial_ref)
-
-#Delete extra Fields
-printit("Deleting extra fields from swl table copy.")
-swl_copy_1 = arcpy.management.DeleteField(swl_cwi_pt, ["OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID", "RELATEID_1", "UNIQUE_NO", "WELLNAME", "TOWNSHIP",
-                                                     "RANGE", "RANGE_DIR",
-                                                     "SECTION", "SUBSECTION", "MGSQUAD_C", "ELEV_MC", "STATUS_C", "USE_C",
-                                                     "LOC_MC", "LOC_SRC", "DATA_SRC", "DEPTH_DRLL", "DEPTH_COMP", "DATE_DRLL",
-                                                     "CASE_DIAM", "CASE_DEPTH", "GROUT", "POLLUT_DST", "POLLUT_DIR", "POLLUT_TYP",
-                                                     "STRAT_DATE", "STRAT_UPD", "STRAT_SRC", "STRAT_GEOL", "STRAT_MC", "DEPTH2BDRK",
-                                                     "FIRST_BDRK", "LAST_STRAT", "OHTOPUNIT", "OHBOTUNIT", "CUTTINGS", "CORE",
-                                                     "BHGEOPHYS", "GEOCHEM", "WATERCHEM", "OBWELL", "SWL", "DH_VIDEO", "INPUT_SRC", "UNUSED",
-                                                     "ENTRY_DATE", "UPDT_DATE", "GEOC_TYPE", "GCM_CODE", "GEOC_SRC", "GEOC_PRG", "UTME", "UTMN",
-                                                     "GEOC_ENTRY", "GEOC_DATE", "GEOCUPD_ENTRY", "GEOCUPD_DATE", "RCVD_DATE", "WELL_LABEL",
-                                                     "WELLID_1", "SWLCOUNT", "SWLDATE", "SWLAVGMEAS", "SWLAVGELEV", "BDRKELEV", "OHTOPELEV",
-                                                     "OHBOTELEV", "BOTHOLELEV", "LOGURL", "STRATURL", "ORIG_FID"])[0]
+swl_copy_1 = arcpy.conversion.ExportFeatures(swl_copy, swl_cwi_pt,
+                                             field_mapping=keep_field_mappings(swl_copy, SWL_DROP))[0]
+
+# Add meas_elev field if it is not already in the swl table
+if not any(name.upper() == "MEAS_ELEV" for name in _list_field_names(swl_copy_1)):
+    arcpy.management.AddField(swl_copy_1, "meas_elev", "DOUBLE")
+    _list_field_names.cache_clear()
 
 printit("Recalculating elevation and meas_elev fields using DEM.")
-swl_TableSelect_1_ = arcpy.management.CalculateFields(swl_copy_1,"PYTHON3",[["ELEVATION", "!dem!", ""], ["meas_elev", "!dem! - !measuremt!", ""]])[0]
+with arcpy.da.Editor(workspace): #edit session commits or rolls back all cursor updates together
+    with arcpy.da.UpdateCursor(swl_copy_1, ["dem", "measuremt", "ELEVATION", "meas_elev"]) as cursor:
+        for row in cursor:
+            dem = row[0]
+            row[2] = dem
+            row[3] = dem - row[1] if dem is not None and row[1] is not None else None
+            cursor.updateRow(row)
 
 #%% 7 Clean Strat table
 
+arcpy.SetProgressorPosition()
+arcpy.SetProgressorLabel("Cleaning strat table...")
 printit("Begin cleaning strat table.")
 
-# Copy strat table
-printit("Copying strat table.")
-strat_copy = os.path.join(workspace, "strat_unloc_copy")
-arcpy.management.Copy(strat_table, strat_copy)
-
-#Delete extra Fields
-printit("Deleting extra fields from strat table copy.")
-strat_copy_1 = arcpy.management.DeleteField(strat_copy, ["OBJECTID_1", "Join_Count", "TARGET_FID", "JOIN_FID",
-                                                        "RELATEID_1", "COUNTY_C", "UNIQUE_NO", "WELLNAME", "TOWNSHIP", "RANGE", "RANGE_DIR",
-                                                        "SECTION", "SUBSECTION", "MGSQUAD_C", "ELEV_MC", "STATUS_C", "USE_C",
-                                                        "LOC_MC", "LOC_SRC", "DATA_SRC", "DEPTH_DRLL", "DEPTH_COMP", "DATE_DRLL",
-                                                        "CASE_DIAM", "CASE_DEPTH", "GROUT", "POLLUT_DST", "POLLUT_DIR", "POLLUT_TYP",
-                                                        "STRAT_DATE", "STRAT_UPD", "STRAT_SRC", "STRAT_GEOL", "STRAT_MC", "DEPTH2BDRK",
-                                                        "FIRST_BDRK", "LAST_STRAT", "OHTOPUNIT", "OHBOTUNIT", "CUTTINGS", "CORE",
-                                                        "BHGEOPHYS", "GEOCHEM", "WATERCHEM", "OBWELL", "SWL", "DH_VIDEO", "INPUT_SRC", "UNUSED",
-                                                        "ENTRY_DATE", "UPDT_DATE", "GEOC_TYPE", "GCM_CODE", "GEOC_SRC", "GEOC_PRG", "UTME", "UTMN",
-                                                        "GEOC_ENTRY", "GEOC_DATE", "GEOCUPD_ENTRY", "GEOCUPD_DATE", "RCVD_DATE", "WELL_LABEL",
-                                                        "WELLID_1", "SWLCOUNT", "SWLDATE", "SWLAVGMEAS", "SWLAVGELEV", "BDRKELEV", "OHTOPELEV",
-                                                        "OHBOTELEV", "BOTHOLELEV", "LOGURL", "STRATURL", "ORIG_FID"])[0]
+# Copy strat table without extra fields
+printit("Copying strat table without extra fields.")
+strat_cwi_clean = os.path.join(workspace, "strat_unloc_clean")
+arcpy.conversion.ExportTable(strat_table, strat_cwi_clean,
+                             field_mapping=keep_field_mappings(strat_table, STRAT_DROP))
 
 #Add Fields
 printit("Adding required fields to strat table copy.")
-strat_cwi_clean = os.path.join(workspace, "strat_unloc_clean")
-arcpy.management.Copy(strat_copy_1, strat_cwi_clean)
 strat_cwi_TableSelect_4_ = arcpy.management.AddFields(strat_cwi_clean,[["elev_top", "FLOAT", "", "", "", ""], ["elev_bot", "FLOAT", "", "", "", ""]])[0]
+_list_field_names.cache_clear()
 
-# Calculate new Fields
+# Calculate new Fields in a single pass over the table
 printit("Calculating elev_top and elev_bot field values.")
-strat_cwi_TableSelect_5_ = arcpy.management.CalculateFields(strat_cwi_TableSelect_4_,"PYTHON3",[["elev_top", "!dem! - !depth_top!", ""], ["elev_bot", "!dem! - !depth_bot!", ""]])[0]
+with arcpy.da.Editor(workspace): #edit session commits or rolls back all cursor updates together
+    with arcpy.da.UpdateCursor(strat_cwi_TableSelect_4_, ["dem", "depth_top", "depth_bot", "elev_top", "elev_bot"]) as cursor:
+        for row in cursor:
+            dem = row[0]
+            if dem is not None:
+                row[3] = dem - row[1] if row[1] is not None else None
+                row[4] = dem - row[2] if row[2] is not None else None
+                cursor.updateRow(row)
 
 
 #%% 8 Delete temporary files/fields
 
-printit("Deleting temporary files from output geodatabase.")
+arcpy.SetProgressorPosition()
+arcpy.ResetProgressor()
+
+printit("Deleting temporary files from memory.")
 try:
-    arcpy.management.Delete(cons_copy)
-    arcpy.management.Delete(dpl_copy)
-    arcpy.management.Delete(swl_copy)
-    arcpy.management.Delete(strat_copy)
+    arcpy.management.Delete([dpl_copy, swl_copy])
 
 except:
     printit("Warning: unable to delete all temporary files.")
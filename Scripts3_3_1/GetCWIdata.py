@@ -71,6 +71,48 @@ def correctGeometry(file, geometry1, geometry2):
             printerror("Error: {0} does not have {1} geometry.".format(os.path.basename(file), geometry1))
     #else: printit("{0} has {1} geometry.".format(os.path.basename(file), geometry))
 
+# Define function to export a table to the output geodatabase
+# ExportTable replaces the deprecated TableToTable. Which one is available is checked once, when the script starts.
+
+if hasattr(arcpy.conversion, "ExportTable"):
+    def exportTable(in_table, out_table):
+        arcpy.conversion.ExportTable(in_table, out_table)
+else:
+    def exportTable(in_table, out_table):
+        arcpy.conversion.TableToTable(in_table, os.path.dirname(out_table), os.path.basename(out_table))
+
+# Define function to add data source field and fill it with a constant value
+
+def addDataSource(table, source):
+    arcpy.management.AddField(table, "Data_Source", "TEXT", 12)
+    with arcpy.da.UpdateCursor(table, ["Data_Source"]) as cursor:
+        for row in cursor:
+            cursor.updateRow([source])
+
+# Define function to build a where clause that limits a statewide table to the wells in the well point file
+# The database can use its relateid index, so only matching rows are sent back for the join
+
+def relateidWhereClause(table, relateids):
+    relateid_field = arcpy.AddFieldDelimiters(table, "relateid")
+    values = []
+    for relateid in sorted(relateids):
+        if isinstance(relateid, str):
+            values.append("'{0}'".format(relateid.replace("'", "''")))
+        else:
+            values.append(str(relateid))
+    # split values into lists of 1000 to stay within database limits on IN lists
+    in_lists = ["{0} IN ({1})".format(relateid_field, ", ".join(values[i:i + 1000])) for i in range(0, len(values), 1000)]
+    return " OR ".join(in_lists)
+
+# Define function to select statewide points that fall within the xsln buffer
+# Selecting by location lets the database spatial index find the points instead of clipping the statewide file.
+# The selected layer is used directly as spatial join input, so no clipped copy is written.
+
+def selectPoints(in_points, clip_polygons, layer_name):
+    points_layer = arcpy.management.MakeFeatureLayer(in_points, layer_name)[0]
+    arcpy.management.SelectLayerByLocation(points_layer, "INTERSECT", clip_polygons, "", "NEW_SELECTION")
+    return points_layer
+
 # %%
 # 2 Set parameters
 
@@ -80,8 +122,12 @@ buffer_distance = int(arcpy.GetParameterAsText(2)) #meters
 dem_raster = arcpy.GetParameterAsText(3)
 strat_boolean = arcpy.GetParameter(4)
 dpl_boolean = arcpy.GetParameter(5)
+inter_ws = "memory" #workspace for temporary files that are deleted before the tool finishes
 printit("Variables set with tool parameter inputs.")
 
+# Allow geoprocessing tools that support parallel processing to use all cores.
+arcpy.env.parallelProcessingFactor = "100%"
+
 #Input Data QAQC
 #check for invalid buffer value
 if buffer_distance <= 0 :
@@ -92,6 +138,12 @@ if buffer_distance <= 0 :
 if dem_raster != "dem" :
     printerror("Error: Raster name not valid. Rename land surface DEM raster to exactly 'dem' in Contents pane.")
     raise SystemExit
+
+#check that the CWI database can be reached before buffering
+cwi_sde = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde'
+if not arcpy.Exists(os.path.join(cwi_sde, 'mgs_cwi.cwi.loc_wells_c5c2')):
+    printerror("Error: Unable to connect to CWI database. Check connection to {0}.".format(cwi_sde))
+    raise SystemExit
     
 #%% 3 Buffer xsln file
 printit("Buffering xsln file.")
@@ -99,15 +151,18 @@ printit("Buffering xsln file.")
 xsln_buffer = os.path.join(output_gdb, "xsln_buffer")
 arcpy.analysis.Buffer(xsln, xsln_buffer, buffer_distance, '', "FLAT")
 
-#%% 4 Clip statewide wwpt file by xsln buffer
+# Dissolve buffers into one mask for selecting statewide points
+# Spatial joins still use the per-xsln buffers to attach xsln attributes
+xsln_buffer_dissolved = os.path.join(inter_ws, "xsln_buffer_dissolved")
+arcpy.management.Dissolve(xsln_buffer, xsln_buffer_dissolved, "", "", "SINGLE_PART")
 
-printit("Clipping statewide CWI wwpt file with xsln buffer.")
-arcpy.env.overwriteOutput = True
+#%% 4 Select statewide wwpt points within xsln buffer
 
-state_wwpt = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.loc_wells'
-wwpt_temp = os.path.join(output_gdb, 'wwpt_temp')
+printit("Selecting statewide CWI wwpt points within xsln buffer.")
+arcpy.env.overwriteOutput = True
 
-arcpy.analysis.Clip(state_wwpt, xsln_buffer, wwpt_temp)
+state_wwpt = os.path.join(cwi_sde, 'mgs_cwi.cwi.loc_wells')
+wwpt_temp = selectPoints(state_wwpt, xsln_buffer_dissolved, "wwpt_temp_layer")
 
 wwpt_count_result = arcpy.management.GetCount(wwpt_temp)
 wwpt_count = int(wwpt_count_result[0])
@@ -133,28 +188,35 @@ arcpy.env.overwriteOutput = True
 #ExtractMultiValuesToPoints(wwpt, [dem_raster, "dem"], "NONE")
 ExtractMultiValuesToPoints(wwpt, dem_raster, "NONE")
 
+#Add source field so it can be filled in the same pass as elevation
+arcpy.management.AddField(wwpt, "Data_Source", "TEXT", 12)
+
+# dem field is kept because Clean CWI Data uses it on the joined cons table
 printit("Copying DEM values to elevation field.")
-wwpt_cwi_TableSelect_1_ = arcpy.management.CalculateFields(wwpt,"PYTHON3",[["elevation", "!dem!", ""]])[0]
+with arcpy.da.UpdateCursor(wwpt, ["dem", "elevation", "Data_Source"]) as cursor:
+    for row in cursor:
+        row[1] = row[0]
+        row[2] = "Verified"
+        cursor.updateRow(row)
 
-#Add source
-wwpt_cwi_TableSelect_2_ = arcpy.management.AddField(wwpt, "Data_Source", "TEXT", 12,"", "","","")
-wwpt_cwi_TableSelect_3_ = arcpy.management.CalculateField(wwpt_cwi_TableSelect_2_, "Data_Source", "'Verified'","","","","")
+# List well relateids, used to limit statewide table queries to wells in the well point file
+with arcpy.da.SearchCursor(wwpt, ["relateid"]) as cursor:
+    wwpt_relateids = {row[0] for row in cursor if row[0] is not None}
 
 #%%
 # 7 Make strat table
 if strat_boolean == True:
-    printit("Clipping statewide stratigraphy data with xsln buffer.")
+    printit("Selecting statewide stratigraphy points within xsln buffer.")
 
     #I think this point file has all of the attributes needed?
-    state_strat_points = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.stratigraphy'
+    state_strat_points = os.path.join(cwi_sde, 'mgs_cwi.cwi.stratigraphy')
 
-    #clip statewide strat points
-    strat_points_temp = os.path.join(output_gdb, "strat_temp")
-    arcpy.analysis.Clip(state_strat_points, xsln_buffer, strat_points_temp)
+    #select statewide strat points within xsln buffer
+    strat_points_temp = selectPoints(state_strat_points, xsln_buffer_dissolved, "strat_temp_layer")
 
     #spatial join with xsln buffer
     printit("Spatial join xsln attributes to stratigraphy points.")
-    strat_points_temp2 = os.path.join(output_gdb, "strat_temp2")
+    strat_points_temp2 = os.path.join(inter_ws, "strat_temp2")
     arcpy.analysis.SpatialJoin(strat_points_temp, xsln_buffer, strat_points_temp2, 'JOIN_ONE_TO_MANY')
 
     ###%% Extract elevation from DEM
@@ -167,30 +229,21 @@ if strat_boolean == True:
 
     #export strat points temp2 to geodatabase table
     printit("Exporting temp stratigraphy points to geodatabase table.")
-    temp_table_view = "temp_table_view"
-    arcpy.management.MakeTableView(strat_points_temp2, temp_table_view)
     strat_table = os.path.join(output_gdb, "strat")
-    try:
-        #TableToTable is apparently depricated, but the newer version (ExportTable)
-        #isn't working? This way, one of them should work.
-        arcpy.conversion.ExportTable(temp_table_view, strat_table)
-    except:
-        arcpy.conversion.TableToTable(temp_table_view, output_gdb, "strat")
+    exportTable(strat_points_temp2, strat_table)
 
     #Add source
-    strat_cwi_TableSelect_1_ = arcpy.management.AddField(strat_table, "Data_Source", "TEXT", 12,"", "","","")
-    strat_cwi_TableSelect_2_ = arcpy.management.CalculateField(strat_cwi_TableSelect_1_, "Data_Source", "'Verified'","","","","")
+    addDataSource(strat_table, "Verified")
 
 #%%
 # 8 Make SWL table
-printit("Clipping statewide SWL data with xsln buffer.")
+printit("Selecting statewide SWL points within xsln buffer.")
 arcpy.env.overwriteOutput = True
 
-state_swl_points = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.water_level'
+state_swl_points = os.path.join(cwi_sde, 'mgs_cwi.cwi.water_level')
 
-#clip statewide SWL points
-swl_points_temp = os.path.join(output_gdb, "swl_temp")
-arcpy.analysis.Clip(state_swl_points, xsln_buffer, swl_points_temp)
+#select statewide SWL points within xsln buffer
+swl_points_temp = selectPoints(state_swl_points, xsln_buffer_dissolved, "swl_temp_layer")
 
 #spatial join with xsln buffer
 printit("Spatial join xsln attributes to swl points.")
@@ -212,33 +265,25 @@ ExtractMultiValuesToPoints(swl_pt, dem_raster, "NONE")
 #%%
 
 #Add source
-swl_cwi_TableSelect_1_ = arcpy.management.AddField(swl_pt, "Data_Source", "TEXT", 12,"", "","","")
-swl_cwi_TableSelect_2_ = arcpy.management.CalculateField(swl_cwi_TableSelect_1_, "Data_Source", "'Verified'","","","","")
+addDataSource(swl_pt, "Verified")
 
 #%%
 # 9 Make conspy table
 printit("Joining statewide construction data table with wwpt.")
 
-state_construction_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.loc_wells_c5c2'
+state_construction_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.loc_wells_c5c2')
 
 #join statewide construction table and wwpt
-const_temp = arcpy.management.AddJoin(state_construction_tbl, "relateid", wwpt, "relateid",'KEEP_COMMON')
+cons_view = arcpy.management.MakeTableView(state_construction_tbl, "cons_view", relateidWhereClause(state_construction_tbl, wwpt_relateids))[0]
+const_temp = arcpy.management.AddJoin(cons_view, "relateid", wwpt, "relateid",'KEEP_COMMON')
 
 printit("Exporting joined table to geodatabase table.")
 
-temp_table_view2 = "temp_table_view2"
-arcpy.management.MakeTableView(const_temp, temp_table_view2)
 cons_table = os.path.join(output_gdb, "cons")
-try:
-    #TableToTable is apparently depricated, but the newer version (ExportTable)
-    #isn't working? This way, one of them should work.
-    arcpy.conversion.ExportTable(temp_table_view2, cons_table)
-except:
-    arcpy.conversion.TableToTable(temp_table_view2, output_gdb, "cons")
+exportTable(const_temp, cons_table)
 
 #Add source
-cons_cwi_TableSelect_1_ = arcpy.management.AddField(cons_table, "Data_Source", "TEXT", 12,"", "","","")
-cons_cwi_TableSelect_2_ = arcpy.management.CalculateField(cons_cwi_TableSelect_1_, "Data_Source", "'Verified'","","","","")
+addDataSource(cons_table, "Verified")
 
 
 
@@ -250,42 +295,30 @@ cons_cwi_TableSelect_2_ = arcpy.management.CalculateField(cons_cwi_TableSelect_1
 if dpl_boolean == True:
     printit("Joining statewide drop pipe data table with wwpt.")
 
-    state_droppipe_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.loc_wells_c5c1'
+    state_droppipe_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.loc_wells_c5c1')
 
     #join statewide construction table and wwpt
-    const_temp1 = arcpy.management.AddJoin(state_droppipe_tbl, "relateid", wwpt, "relateid",'KEEP_COMMON')
+    dpl_view = arcpy.management.MakeTableView(state_droppipe_tbl, "dpl_view", relateidWhereClause(state_droppipe_tbl, wwpt_relateids))[0]
+    const_temp1 = arcpy.management.AddJoin(dpl_view, "relateid", wwpt, "relateid",'KEEP_COMMON')
 
     printit("Exporting joined table to geodatabase table.")
 
-    temp_table_view3 = "temp_table_view3"
-    arcpy.management.MakeTableView(const_temp1, temp_table_view3)
     cons_table1 = os.path.join(output_gdb, "dpl")
-    try:
-        #TableToTable is apparently depricated, but the newer version (ExportTable)
-        #isn't working? This way, one of them should work.
-        arcpy.conversion.ExportTable(temp_table_view3, cons_table1)
-    except:
-        arcpy.conversion.TableToTable(temp_table_view3, output_gdb, "dpl")
+    exportTable(const_temp1, cons_table1)
 
     #Add source
-    cons1_cwi_TableSelect_1_ = arcpy.management.AddField(cons_table1, "Data_Source", "TEXT", 12,"", "","","")
-    cons1_cwi_TableSelect_2_ = arcpy.management.CalculateField(cons1_cwi_TableSelect_1_, "Data_Source", "'Verified'","","","","")
+    addDataSource(cons_table1, "Verified")
 
 #%%
 # 11 Delete temporary files
+# Selection layers are backed by the statewide data and are not deleted. They are released with the session.
 printit("Deleting temporary files.")
-try: arcpy.management.Delete(wwpt_temp)
-except: printit("Unable to delete {0}.".format(wwpt_temp))
-
 if strat_boolean == True:
-    try: arcpy.management.Delete(strat_points_temp)
-    except: printit("Unable to delete {0}.".format(strat_points_temp))
-
     try: arcpy.management.Delete(strat_points_temp2)
     except: printit("Unable to delete {0}.".format(strat_points_temp2))
 
-try: arcpy.management.Delete(swl_points_temp)
-except: printit("Unable to delete {0}.".format(swl_points_temp))
+try: arcpy.management.Delete(xsln_buffer_dissolved)
+except: printit("Unable to delete {0}.".format(xsln_buffer_dissolved))
 
 
 # %%
@@ -65,6 +65,48 @@ def correctGeometry(file, geometry1, geometry2):
             printerror("Error: {0} does not have {1} geometry.".format(os.path.basename(file), geometry1))
     #else: printit("{0} has {1} geometry.".format(os.path.basename(file), geometry))
 
+# Define function to export a table to the output geodatabase
+# ExportTable replaces the deprecated TableToTable. Which one is available is checked once, when the script starts.
+
+if hasattr(arcpy.conversion, "ExportTable"):
+    def exportTable(in_table, out_table):
+        arcpy.conversion.ExportTable(in_table, out_table)
+else:
+    def exportTable(in_table, out_table):
+        arcpy.conversion.TableToTable(in_table, os.path.dirname(out_table), os.path.basename(out_table))
+
+# Define function to add data source field and fill it with a constant value
+
+def addDataSource(table, source):
+    arcpy.management.AddField(table, "Data_Source", "TEXT", 12)
+    with arcpy.da.UpdateCursor(table, ["Data_Source"]) as cursor:
+        for row in cursor:
+            cursor.updateRow([source])
+
+# Define function to build a where clause that limits a statewide table to the wells in the well point file
+# The database can use its relateid index, so only matching rows are sent back for the join
+
+def relateidWhereClause(table, relateids):
+    relateid_field = arcpy.AddFieldDelimiters(table, "relateid")
+    values = []
+    for relateid in sorted(relateids):
+        if isinstance(relateid, str):
+            values.append("'{0}'".format(relateid.replace("'", "''")))
+        else:
+            values.append(str(relateid))
+    # split values into lists of 1000 to stay within database limits on IN lists
+    in_lists = ["{0} IN ({1})".format(relateid_field, ", ".join(values[i:i + 1000])) for i in range(0, len(values), 1000)]
+    return " OR ".join(in_lists)
+
+# Define function to select statewide points that fall within the xsln buffer
+# Selecting by location lets the database spatial index find the points instead of clipping the statewide file.
+# The selected layer is used directly as spatial join input, so no clipped copy is written.
+
+def selectPoints(in_points, clip_polygons, layer_name):
+    points_layer = arcpy.management.MakeFeatureLayer(in_points, layer_name)[0]
+    arcpy.management.SelectLayerByLocation(points_layer, "INTERSECT", clip_polygons, "", "NEW_SELECTION")
+    return points_layer
+
 # %%
 # 2 Set parameters to work in testing and compiled geopocessing tool
 
@@ -94,6 +136,9 @@ else:
     buffer_distance = 500 #meters, half a mile
     printit("Variables set with hard-coded parameters for testing.")
 
+# Allow geoprocessing tools that support parallel processing to use all cores.
+arcpy.env.parallelProcessingFactor = "100%"
+
 #Input Data QAQC
 #check for invalid buffer value
 if buffer_distance <= 0 :
@@ -105,21 +150,25 @@ if dem_raster != "dem" :
     printerror("Error: Raster name not valid. Rename land surface DEM raster to exactly 'dem' in Contents pane.")
     raise SystemExit
 
+#check that the CWI database can be reached before buffering
+cwi_sde = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde'
+if not arcpy.Exists(os.path.join(cwi_sde, 'mgs_cwi.cwi.unloc_wells_c5c2')):
+    printerror("Error: Unable to connect to CWI database. Check connection to {0}.".format(cwi_sde))
+    raise SystemExit
+
 #%% 3 Buffer xsln file
 printit("Buffering xsln file.")
 
 xsln_buffer = os.path.join(output_gdb, "xsln_buffer")
 arcpy.analysis.Buffer(xsln, xsln_buffer, buffer_distance, '', "FLAT")
 
-#%% 4 Clip statewide wwpt file by xsln buffer
+#%% 4 Select statewide wwpt points within xsln buffer
 
-printit("Clipping statewide CWI wwpt file with xsln buffer.")
+printit("Selecting statewide CWI wwpt points within xsln buffer.")
 arcpy.env.overwriteOutput = True
 
 state_wwpt = r'V:\gdrs\data\pub\us_mn_state_health\water_well_information\fgdb\water_well_information.gdb\unloc_wells'
-wwpt_unloc_temp = os.path.join(output_gdb, 'wwpt_unloc_temp')
-
-arcpy.analysis.Clip(state_wwpt, xsln_buffer, wwpt_unloc_temp)
+wwpt_unloc_temp = selectPoints(state_wwpt, xsln_buffer, "wwpt_unloc_temp_layer")
 
 wwpt_count_result = arcpy.management.GetCount(wwpt_unloc_temp)
 wwpt_count = int(wwpt_count_result[0])
@@ -145,34 +194,30 @@ arcpy.env.overwriteOutput = True
 ExtractMultiValuesToPoints(wwpt_unloc, dem_raster, "NONE")
 
 #Add source
-wwpt_cwi_TableSelect_2_ = arcpy.management.AddField(wwpt_unloc, "Data_Source", "TEXT", 12,"", "","","")
-wwpt_cwi_TableSelect_3_ = arcpy.management.CalculateField(wwpt_cwi_TableSelect_2_, "Data_Source", "'Unverified'","","","","")
+addDataSource(wwpt_unloc, "Unverified")
+
+# List well relateids, used to limit statewide table queries to wells in the well point file
+with arcpy.da.SearchCursor(wwpt_unloc, ["relateid"]) as cursor:
+    wwpt_relateids = {row[0] for row in cursor if row[0] is not None}
 
 #%%
 # 5 Make strat table
 if strat_boolean == True:
     printit("Clipping statewide stratigraphy data with xsln buffer.")
 
-    state_strat_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.unloc_wells_c5st'
+    state_strat_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.unloc_wells_c5st')
 
     #join statewide construction table and wwpt
-    strat_temp = arcpy.management.AddJoin(state_strat_tbl, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
+    strat_view = arcpy.management.MakeTableView(state_strat_tbl, "strat_view", relateidWhereClause(state_strat_tbl, wwpt_relateids))[0]
+    strat_temp = arcpy.management.AddJoin(strat_view, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
 
     printit("Exporting joined table to geodatabase table.")
 
-    temp_table_view5 = "temp_table_view5"
-    arcpy.management.MakeTableView(strat_temp, temp_table_view5)
     strat_table = os.path.join(output_gdb, "strat_unloc")
-    try:
-        #TableToTable is apparently depricated, but the newer version (ExportTable)
-        #isn't working? This way, one of them should work.
-        arcpy.conversion.ExportTable(temp_table_view5, strat_table)
-    except:
-        arcpy.conversion.TableToTable(temp_table_view5, output_gdb, "strat_unloc")
+    exportTable(strat_temp, strat_table)
 
     #Add source
-    strat_cwi_TableSelect_1_ = arcpy.management.AddField(strat_table, "Data_Source", "TEXT", 12,"", "","","")
-    strat_cwi_TableSelect_2_ = arcpy.management.CalculateField(strat_cwi_TableSelect_1_, "Data_Source", "'Unverified'","","","","")
+    addDataSource(strat_table, "Unverified")
 
 
 #%%
@@ -180,92 +225,61 @@ if strat_boolean == True:
 printit("Clipping statewide SWL data with xsln buffer.")
 arcpy.env.overwriteOutput = True
 
-state_swl_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.unloc_wells_c5wl'
+state_swl_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.unloc_wells_c5wl')
 
 #join statewide construction table and wwpt
-swl_temp = arcpy.management.AddJoin(state_swl_tbl, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
+swl_view = arcpy.management.MakeTableView(state_swl_tbl, "swl_view", relateidWhereClause(state_swl_tbl, wwpt_relateids))[0]
+swl_temp = arcpy.management.AddJoin(swl_view, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
 
 printit("Exporting joined table to geodatabase table.")
 
-temp_table_view4 = "temp_table_view4"
-arcpy.management.MakeTableView(swl_temp, temp_table_view4)
 swl_table = os.path.join(output_gdb, "swl_unloc")
-try:
-    #TableToTable is apparently depricated, but the newer version (ExportTable)
-    #isn't working? This way, one of them should work.
-    arcpy.conversion.ExportTable(temp_table_view4, swl_table)
-except:
-    arcpy.conversion.TableToTable(temp_table_view4, output_gdb, "swl_unloc")
+exportTable(swl_temp, swl_table)
 
 #Add source
-swl_cwi_TableSelect_1_ = arcpy.management.AddField(swl_table, "Data_Source", "TEXT", 12,"", "","","")
-swl_cwi_TableSelect_2_ = arcpy.management.CalculateField(swl_cwi_TableSelect_1_, "Data_Source", "'Unverified'","","","","")
+addDataSource(swl_table, "Unverified")
 
 #%%
 # 7 Make conspy table
 printit("Joining statewide construction data table with wwpt.")
 
-state_construction_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.unloc_wells_c5c2'
+state_construction_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.unloc_wells_c5c2')
 
 #join statewide construction table and wwpt
-const_temp = arcpy.management.AddJoin(state_construction_tbl, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
+cons_view = arcpy.management.MakeTableView(state_construction_tbl, "cons_view", relateidWhereClause(state_construction_tbl, wwpt_relateids))[0]
+const_temp = arcpy.management.AddJoin(cons_view, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
 
 printit("Exporting joined table to geodatabase table.")
 
-temp_table_view2 = "temp_table_view2"
-arcpy.management.MakeTableView(const_temp, temp_table_view2)
 cons_table = os.path.join(output_gdb, "cons_unloc")
-try:
-    #TableToTable is apparently depricated, but the newer version (ExportTable)
-    #isn't working? This way, one of them should work.
-    arcpy.conversion.ExportTable(temp_table_view2, cons_table)
-except:
-    arcpy.conversion.TableToTable(temp_table_view2, output_gdb, "cons_unloc")
+exportTable(const_temp, cons_table)
 
 #Add source
-cons_cwi_TableSelect_1_ = arcpy.management.AddField(cons_table, "Data_Source", "TEXT", 12,"", "","","")
-cons_cwi_TableSelect_2_ = arcpy.management.CalculateField(cons_cwi_TableSelect_1_, "Data_Source", "'Unverified'","","","","")
+addDataSource(cons_table, "Unverified")
 
 #%%
 # 8 Make drop pipe table
 if dpl_boolean == True:
     printit("Joining statewide drop pipe data table with wwpt.")
 
-    state_droppipe_tbl = r'I:\EWR\_IMA\HGG\_HYDRO_GEO_GROUNDWATER\Tools\GIS\Pro_DNR_CrossSection_Tool\db20-pg-mgs_cwi-cwiro.sde\mgs_cwi.cwi.unloc_wells_c5c1'
+    state_droppipe_tbl = os.path.join(cwi_sde, 'mgs_cwi.cwi.unloc_wells_c5c1')
 
     #join statewide construction table and wwpt
-    const_temp1 = arcpy.management.AddJoin(state_droppipe_tbl, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
+    dpl_view = arcpy.management.MakeTableView(state_droppipe_tbl, "dpl_view", relateidWhereClause(state_droppipe_tbl, wwpt_relateids))[0]
+    const_temp1 = arcpy.management.AddJoin(dpl_view, "relateid", wwpt_unloc, "relateid",'KEEP_COMMON')
 
     printit("Exporting joined table to geodatabase table.")
 
-    temp_table_view3 = "temp_table_view3"
-    arcpy.management.MakeTableView(const_temp1, temp_table_view3)
     cons_table1 = os.path.join(output_gdb, "dpl_unloc")
-    try:
-        #TableToTable is apparently depricated, but the newer version (ExportTable)
-        #isn't working? This way, one of them should work.
-        arcpy.conversion.ExportTable(temp_table_view3, cons_table1)
-    except:
-        arcpy.conversion.TableToTable(temp_table_view3, output_gdb, "dpl_unloc")
+    exportTable(const_temp1, cons_table1)
 
     #Add source
-    cons1_cwi_TableSelect_1_ = arcpy.management.AddField(cons_table1, "Data_Source", "TEXT", 12,"", "","","")
-    cons1_cwi_TableSelect_2_ = arcpy.management.CalculateField(cons1_cwi_TableSelect_1_, "Data_Source", "'Unverified'","","","","")
+    addDataSource(cons_table1, "Unverified")
 
 #%%
 # 9 Delete temporary files
-printit("Deleting temporary files.")
-try: arcpy.management.Delete(wwpt_unloc_temp)
-except: printit("Unable to delete {0}.".format(wwpt_unloc_temp))
-
-try: arcpy.management.Delete(cons_temp)
-except: printit("Unable to delete {0}.".format(const_temp))
-
-try: arcpy.management.Delete(cons_temp1)
-except: printit("Unable to delete {0}.".format(const_temp1))
-
-try: arcpy.management.Delete(swl_temp)
-except: printit("Unable to delete {0}.".format(swl_temp))
+# The well selection layer and joined table views are backed by the statewide data and are not deleted.
+# They are released with the session, so there are no temporary files to delete.
 
 
 # %%
@@ -20,6 +20,10 @@ import arcpy
 import os
 import sys
 import datetime
+import math
+import struct
+from array import array
+from collections import defaultdict
 
 # Record tool start time
 toolstart = datetime.datetime.now()
@@ -39,6 +43,23 @@ def printerror(message):
     else:
         print(message)
 
+# Define function to measure distance along a line to the closest point on it.
+# Segments are (start x, start y, unit x, unit y, segment length, measure at segment start).
+
+def measureOnSegments(segments, x, y):
+    best_measure = 0.0
+    best_distance = None
+    for start_x, start_y, unit_x, unit_y, seg_length, seg_measure in segments:
+        along = (x - start_x) * unit_x + (y - start_y) * unit_y
+        along = min(max(along, 0.0), seg_length)
+        dx = x - start_x - along * unit_x
+        dy = y - start_y - along * unit_y
+        distance = dx * dx + dy * dy
+        if best_distance is None or distance < best_distance:
+            best_distance = distance
+            best_measure = seg_measure + along
+    return best_measure
+
 # %% 2 Set parameters to work in testing and compiled geopocessing tool
 
 if (len(sys.argv) > 1):
@@ -59,6 +80,14 @@ else:
     output_gdb_location = r'D:\Bedrock_Xsec_Scripting\Raster_profiles_062823.gdb' #output gdb
     vertical_exaggeration = int(50)
     printit("Variables set with hard-coded parameters for testing.")
+
+inter_ws = "memory" #workspace for temporary files that are deleted before the tool finishes
+
+# To allow overwriting outputs change overwriteOutput option to True.
+arcpy.env.overwriteOutput = True
+
+# Allow geoprocessing tools that support parallel processing to use all cores.
+arcpy.env.parallelProcessingFactor = "100%"
     
 # %% 2A Data QC
 
@@ -69,12 +98,8 @@ if xsln_count == 0:
     printerror("Warning: cross section line file is empty. Tool will not run correctly.")
 
 #determine if input cross section lines have multipart features
-multipart = False
 with arcpy.da.SearchCursor(xsln_file_orig, ["SHAPE@"]) as cursor:
-    for row in cursor:
-        if row[0].isMultipart:
-            multipart = True
-            break
+    multipart = any(row[0].isMultipart for row in cursor)
 if multipart:
     printerror("Warning: cross section file contains multipart features. Continuing may result in errors. To avoid errors, convert multipart feature to single part.")
 
@@ -102,11 +127,12 @@ for raster in rasters_list:
 
 # %% 4 Set spatial reference based on xsln file
 
+xsln_basename = os.path.basename(xsln_file_orig)
 spatialref = arcpy.Describe(xsln_file_orig).spatialReference
 if spatialref.name == "Unknown":
-    printerror("{0} file has an unknown spatial reference. Continuing may result in errors.".format(os.path.basename(xsln_file_orig)))
+    printerror("{0} file has an unknown spatial reference. Continuing may result in errors.".format(xsln_basename))
 else:
-    printit("Spatial reference set as {0} to match {1} file.".format(spatialref.name, os.path.basename(xsln_file_orig)))
+    printit("Spatial reference set as {0} to match {1} file.".format(spatialref.name, xsln_basename))
 
 #Set 2d spatial reference
 spatialref_2d = spatialref
@@ -130,31 +156,89 @@ for name in fields_no_join:
     if name in xsln_field_names:
         xsln_field_names.remove(name)
 
+#field definitions for adding joined xsln fields to the 2d profiles file
+join_field_types = {'String': 'TEXT', 'SmallInteger': 'SHORT', 'Integer': 'LONG', 'BigInteger': 'BIGINTEGER',
+                    'Single': 'FLOAT', 'Double': 'DOUBLE', 'Date': 'DATE', 'DateOnly': 'DATEONLY',
+                    'TimeOnly': 'TIMEONLY', 'TimestampOffset': 'TIMESTAMPOFFSET', 'GUID': 'GUID', 'GlobalID': 'GUID',
+                    'Blob': 'BLOB'}
+fields_2d_names = [field[0] for field in fields_2d]
+xsln_join_fields = []
+for field in xsln_fields:
+    #merged output only keeps id and raster name fields, so nothing is joined
+    if merge_boolean == True or field.name not in xsln_field_names or field.type in ('OID', 'Geometry'):
+        continue
+    if field.name in fields_2d_names:
+        printit("Warning: {0} field in {1} has the same name as a 2d profile field and will not be joined.".format(field.name, xsln_basename))
+    elif field.type not in join_field_types:
+        printit("Warning: {0} field in {1} has unsupported field type {2} and will not be joined.".format(field.name, xsln_basename, field.type))
+    else:
+        xsln_join_fields.append([field.name, join_field_types[field.type], field.aliasName, field.length])
+xsln_field_names = [field[0] for field in xsln_join_fields]
+
+#read xsln attributes once, keyed by xsln id
+xsln_attributes = {}
+if xsln_field_names:
+    with arcpy.da.SearchCursor(xsln_file_orig, [xsln_etid_field] + xsln_field_names) as cursor:
+        for row in cursor:
+            if row[0] not in xsln_attributes:
+                xsln_attributes[row[0]] = row[1:]
+
 #######create empty output file for merged profiles if boolean is True
 if merge_boolean == True:
     merged_profiles_2d_name = "all_profiles_2d" + "_" + str(vertical_exaggeration) + "x"
     merged_profiles_2d = os.path.join(output_gdb_location, merged_profiles_2d_name)
     arcpy.management.CreateFeatureclass(output_gdb_location, merged_profiles_2d_name, 'POLYLINE', '', 'DISABLED', 'DISABLED')
 
+# Scale factor from xsln distance in meters to 2d x coordinate in feet divided by vertical exaggeration
+scale_2d = 1.0 / (0.3048 * vertical_exaggeration)
+
+# WKB linestring header (little endian byte order, geometry type 2, vertex count)
+wkb_header = struct.Struct('<BII')
+
+# Read xsln geometries once for use with every raster surface
+xsln_cache = []
+with arcpy.da.SearchCursor(xsln_file_orig, ['OID@', 'SHAPE@', xsln_etid_field]) as xsln:
+    for line in xsln:
+        et_id = line[2]
+        xsln_vertices = [(apex.X, apex.Y) for apex in line[1].getPart(0)]
+        # Split xsln into segments so profile vertices can be measured without MeasureOnLine
+        xsln_segments = []
+        xsln_measure = 0.0
+        for (start_x, start_y), (end_x, end_y) in zip(xsln_vertices, xsln_vertices[1:]):
+            seg_length = math.hypot(end_x - start_x, end_y - start_y)
+            if seg_length > 0:
+                xsln_segments.append((start_x, start_y, (end_x - start_x) / seg_length,
+                                      (end_y - start_y) / seg_length, seg_length, xsln_measure))
+                xsln_measure += seg_length
+        xsln_cache.append((et_id, xsln_segments))
+
 #%% 6 Create 3D profiles from input raster surface
 for raster in rasters_list:
     name = os.path.basename(raster)
     printit("Creating 3d profiles for {0} raster surface.".format(name))
     # Use interpolate shape to create 3d profiles along xs lines
-    profiles_3d_multi = os.path.join(output_gdb_location, name + "_profiles3d_multi")
+    profiles_3d_multi = os.path.join(inter_ws, name + "_profiles3d_multi")
     arcpy.ddd.InterpolateShape(raster, xsln_file_orig, profiles_3d_multi)
     # Convert to single part in case there was a gap in the raster
-    printit("Converting multipart 3d profiles into single part for {0} raster surface.".format(name))
-    profiles_3d = os.path.join(output_gdb_location, name + "_profiles3d")
-    arcpy.management.MultipartToSinglepart(profiles_3d_multi, profiles_3d)
-    # Delete multipart profiles
-    printit("Deleting multipart profiles file for {0} raster surface.".format(name))
-    arcpy.management.Delete(profiles_3d_multi)
+    with arcpy.da.SearchCursor(profiles_3d_multi, ["SHAPE@"]) as cursor:
+        needs_split = any(row[0].isMultipart for row in cursor)
+    if needs_split:
+        printit("Converting multipart 3d profiles into single part for {0} raster surface.".format(name))
+        profiles_3d = os.path.join(inter_ws, name + "_profiles3d")
+        arcpy.management.MultipartToSinglepart(profiles_3d_multi, profiles_3d)
+        # Delete multipart profiles
+        printit("Deleting multipart profiles file for {0} raster surface.".format(name))
+        arcpy.management.Delete(profiles_3d_multi)
+    else:
+        # No gaps in the raster along the xslns, so profiles are already single part
+        profiles_3d = profiles_3d_multi
     
-    # Create empty feature dataset for storing 3d profiles by xs number. Necessary for 2d geometry loop below.
-    printit("Creating feature dataset for storing 3d profiles by cross section number for {0} raster surface.".format(name))
-    profiles_3d_byxsec = os.path.join(output_gdb_location, name + "profiles3d_byxsec")
-    arcpy.management.CreateFeatureDataset(output_gdb_location, name + "profiles3d_byxsec", spatialref)
+    # Group 3d profile geometries by xs number in a single pass. Necessary for 2d geometry loop below.
+    printit("Grouping 3d profiles by cross section number for {0} raster surface.".format(name))
+    profiles_by_id = defaultdict(list)
+    with arcpy.da.SearchCursor(profiles_3d, ['SHAPE@', xsln_etid_field]) as profile:
+        for feature in profile:
+            profiles_by_id[feature[1]].append(feature[0])
 
 # Convert 3D xsln's to 2D view
     # Create empty 2d profiles file
@@ -174,45 +258,43 @@ for raster in rasters_list:
    
 # Convert to 2d view and write geometry
     printit("Starting 2D geometry creation for {0} raster surface.".format(name))
-    with arcpy.da.SearchCursor(xsln_file_orig, ['OID@', 'SHAPE@', xsln_etid_field]) as xsln:
-        for line in xsln:
-            et_id = line[2]
-            xsln_pointlist = []
-            for apex in line[1].getPart(0):
-                # Creates a polyline geometry object from xsln vertex points.
-                # Necessary for MeasureOnLine method used later.
-                point = arcpy.Point(apex.X, apex.Y)
-                xsln_pointlist.append(point)
-            xsln_array = arcpy.Array(xsln_pointlist)
-            xsln_geometry = arcpy.Polyline(xsln_array)
-            # Create a new 3d profile file with only line associated with current xsln
-            profile_by_xs_file = os.path.join(profiles_3d_byxsec, "{0}_{1}".format(xsln_etid_field, et_id))
-            arcpy.analysis.Select(profiles_3d, profile_by_xs_file, '"{0}" = \'{1}\''.format(xsln_etid_field, et_id))
-            printit("Writing 2D geometry for profile associated with xsec {0} on {1} surface.".format(et_id, name))
-            with arcpy.da.SearchCursor(profile_by_xs_file, ['OID@', 'SHAPE@', xsln_etid_field]) as profile:
-                for feature in profile:
-                    et_id = feature[2]
-                    profile_pointlist = []
-                    # Convert vertices into 2d space and put them in an array
-                    for vertex in feature[1].getPart(0):
-                        xy_mapview = arcpy.Point(vertex.X, vertex.Y)
-                        x_2d_meters = xsln_geometry.measureOnLine(xy_mapview)
-                        x_2d_feet = x_2d_meters/0.3048
-                        x_2d = x_2d_feet/vertical_exaggeration
-                        y_2d = vertex.Z
-                        xy_xsecview = arcpy.Point(x_2d, y_2d)
-                        profile_pointlist.append(xy_xsecview)
-                    profile_array = arcpy.Array(profile_pointlist)
-                    profile_polyline = arcpy.Polyline(profile_array)
-                    # Use Update cursor to write geometry to new file
-                    with arcpy.da.InsertCursor(profiles_2d, ['SHAPE@', xsln_etid_field, 'raster_name']) as cursor2d:
-                        cursor2d.insertRow([profile_polyline, et_id, name])
-    # Delete temporary feature dataset
-    printit("Deleting temporary feature dataset for {0} raster surface.".format(name))
-    try:
-        arcpy.management.Delete(profiles_3d_byxsec)
-    except:
-        printit("Unable to delete temporary feature dataset.")
+    # Open one insert cursor for all profiles written from this raster surface
+    # Step progressor advances about every 1% of xslns instead of printing a message per xsln
+    progress_step = max(1, xsln_count // 100)
+    arcpy.SetProgressor("step", "Writing 2D geometry for {0} raster surface...".format(name), 0, xsln_count, progress_step)
+    # Edit session commits all inserted rows together, or rolls them back if an insert fails
+    with arcpy.da.Editor(output_gdb_location), \
+         arcpy.da.InsertCursor(profiles_2d, ['SHAPE@', xsln_etid_field, 'raster_name']) as cursor2d:
+        for xsln_number, (et_id, xsln_segments) in enumerate(xsln_cache, 1):
+            if xsln_number % progress_step == 0:
+                arcpy.SetProgressorPosition()
+            # Straight xslns (one segment) are projected directly onto the line direction
+            straight_xsln = len(xsln_segments) == 1
+            if straight_xsln:
+                start_x, start_y, unit_x, unit_y, xsln_length, seg_measure = xsln_segments[0]
+            # Loop through 3d profiles associated with current xsln
+            for feature_shape in profiles_by_id.get(et_id, ()):
+                profile_coords = []
+                # Convert vertices into 2d space and put them in a flat coordinate list
+                for vertex in feature_shape.getPart(0):
+                    if straight_xsln:
+                        x_2d_meters = (vertex.X - start_x) * unit_x + (vertex.Y - start_y) * unit_y
+                        x_2d_meters = min(max(x_2d_meters, 0.0), xsln_length)
+                    else:
+                        x_2d_meters = measureOnSegments(xsln_segments, vertex.X, vertex.Y)
+                    x_2d = x_2d_meters * scale_2d
+                    y_2d = vertex.Z
+                    profile_coords.extend((x_2d, y_2d))
+                # Pack coordinates as a WKB linestring instead of building Point objects.
+                # ArcGIS Pro only runs on little endian Windows, so native doubles match the header byte order.
+                vertex_count = len(profile_coords) // 2
+                if vertex_count < 2: #a single vertex profile fragment cannot be written as a line
+                    continue
+                profile_wkb = wkb_header.pack(1, 2, vertex_count) + array('d', profile_coords).tobytes()
+                profile_polyline = arcpy.FromWKB(bytearray(profile_wkb))
+                # Write geometry to new file
+                cursor2d.insertRow((profile_polyline, et_id, name))
+    arcpy.ResetProgressor()
     printit("Deleting 3D files.")
     try:
         arcpy.management.Delete(profiles_3d)
@@ -220,10 +302,13 @@ for raster in rasters_list:
         printit("Unable to delete {0}.".format(profiles_3d))
     
     # join other fields that are in xsln file
-    arcpy.management.JoinField(profiles_2d, xsln_etid_field, xsln_file_orig, xsln_etid_field, xsln_field_names)
-
-if merge_boolean == True: 
-    arcpy.management.DeleteField(profiles_2d,["OBJECTID", "Shape", "Shape_Length", xsln_etid_field,"raster_name"],"KEEP_FIELDS")
+    if merge_boolean == False and xsln_field_names:
+        arcpy.management.AddFields(profiles_2d, xsln_join_fields)
+        with arcpy.da.UpdateCursor(profiles_2d, [xsln_etid_field] + xsln_field_names) as cursor:
+            for row in cursor:
+                attributes = xsln_attributes.get(row[0])
+                if attributes is not None:
+                    cursor.updateRow((row[0],) + attributes)
 
 
 